@@ -6,7 +6,8 @@ Confirms webhook authenticity
 Sends alerts on Teams when required
 
 Modules:
-    3rd Party: termcolor, dateutil, tzlocal, pytz, datetime, re
+    3rd Party: termcolor, dateutil, tzlocal, pytz, datetime, functools, hmac,
+        socket, queue, threading, time, atexit, fastjsonschema
     Custom: teamschat, plugin
 
 Classes:
@@ -17,7 +18,29 @@ Classes:
 
 Functions
 
-    None
+    _fast_parse
+        Parse a CloudFlare timestamp, trying the known formats first
+
+    _fmt_ts
+        Convert a raw timestamp to a simple local time (cached)
+
+    _pack_ips
+        Pack source IP addresses to bytes, skipping any that don't parse
+
+    _cprint
+        Print a coloured message to the terminal
+
+    _drain
+        Background worker that sends queued alerts in batches
+
+    _dispatch
+        Send a batch of queued alerts, grouped by handler
+
+    _flush
+        Send any alerts still queued when the process exits
+
+    _start_worker
+        Start the background worker, if it isn't running yet
 
 Exceptions:
 
@@ -27,20 +50,56 @@ Misc Variables:
 
     LOCATION : str
         The location of the config file
+    CLOUDFLARE_SCHEMA : dict
+        JSON Schema that incoming webhooks must match
+    DEBUG : bool
+        Print the full webhook, alert, and fields to the terminal
+    _MSG_TMPL : str
+        Template for the main Teams message
+    _HEALTHY_TMPL : str
+        Template for the health message, when the service is healthy
+    _UNHEALTHY_TMPL : str
+        Template for the health message, when the service is unhealthy
+    _QUEUE : queue.Queue
+        Alerts waiting for the background worker
+    _QUEUE_SIZE : int
+        The most alerts that can wait in the queue
+    _BATCH_SIZE : int
+        The most alerts the worker sends at once
+    _BATCH_WINDOW : float
+        How long (seconds) the worker waits to fill a batch
+    _WORKER : threading.Thread
+        The background worker, once started
+    _WORKER_LOCK : threading.Lock
+        Makes sure only one background worker is started
+    _colored : function
+        termcolor.colored, once it has been imported
 
 Limitations/Requirements:
-    IPv6 addresses aren't supported to log to SQL
+    Only the first source IP address is logged to SQL
+    Alerts are sent to Teams and SQL by a background worker
+        If the queue is full (eg, Teams is hanging), new alerts are dropped
+        Queued alerts are flushed on a normal exit
+        A batch the worker is already sending when the process exits,
+            or anything queued when the process is killed, is lost
 
 Author:
     Luke Robertson - April 2023
 """
 
 
-import termcolor
+import hmac
+import socket
+import queue
+import threading
+import atexit
+from time import monotonic
 from dateutil.parser import parse
 from tzlocal import get_localzone
 from pytz import timezone
 from datetime import datetime
+from functools import lru_cache
+import fastjsonschema
 
 from core import teamschat
 from core import plugin
@@ -49,6 +108,353 @@ from core import plugin
 # Location of the config file
 LOCATION = 'plugins\\cloudflare\\config.yaml'
 
+# The webhook structure we rely on
+#   All webhooks need a 'data' object, with string timestamps
+#   Known alert types also need the fields in their field map
+#   Unknown alert types are accepted, and use the generic field map
+CLOUDFLARE_SCHEMA = {
+    'type': 'object',
+    'required': ['data'],
+    'properties': {
+        'alert_type': {'type': 'string'},
+        'time': {'type': 'string'},
+        'data': {
+            'type': 'object',
+            'properties': {
+                'timestamp': {'type': 'string'},
+                'time': {'type': 'string'},
+            },
+        },
+    },
+    'allOf': [
+        {
+            'if': {
+                'required': ['alert_type'],
+                'properties': {
+                    'alert_type': {'const': 'load_balancing_health_alert'},
+                },
+            },
+            'then': {
+                'properties': {
+                    'data': {
+                        'required': ['pool_name', 'origin_name', 'new_health'],
+                        'properties': {
+                            'pool_name': {'type': 'string'},
+                            'origin_name': {'type': 'string'},
+                            'new_health': {'type': 'string'},
+                        },
+                    },
+                },
+            },
+        },
+        {
+            'if': {
+                'required': ['alert_type'],
+                'properties': {
+                    'alert_type': {
+                        'const': 'health_check_status_notification'
+                    },
+                },
+            },
+            'then': {
+                'properties': {
+                    'data': {
+                        'required': ['name', 'status'],
+                        'properties': {
+                            'name': {'type': 'string'},
+                            'status': {'type': 'string'},
+                        },
+                    },
+                },
+            },
+        },
+    ],
+}
+
+# Print verbose webhook details to the terminal
+DEBUG = False
+
+# Alerts waiting to be sent to Teams and logged to SQL
+_QUEUE_SIZE = 1000
+_QUEUE = queue.Queue(maxsize=_QUEUE_SIZE)
+_BATCH_SIZE = 20
+_BATCH_WINDOW = 0.05
+
+# The background worker, started when the first alert is queued
+_WORKER = None
+_WORKER_LOCK = threading.Lock()
+
+# termcolor.colored, imported when the first message is printed
+_colored = None
+
+# Teams message templates, filled in from the webhook fields
+_MSG_TMPL = (
+    '<b><span style="color:Yellow">{type}</span></b> on '
+    '<b><span style="color:Orange">{pool}</span></b> at {time}'
+)
+_HEALTHY_TMPL = (
+    'Current status for <b><span style="color:Orange">{service}</span></b> '
+    'is <b><span style="color:Lime">{health}</span></b>'
+)
+_UNHEALTHY_TMPL = (
+    'Current status for <b><span style="color:Orange">{service}</span></b> '
+    'is <b><span style="color:Red">{health}</span></b>'
+)
+
+
+def _fast_parse(timestamp):
+    """Parse a timestamp string into a datetime object
+
+    CloudFlare timestamps are normally ISO 8601
+    These are parsed with the standard library, which is much faster
+    Anything else falls back to the (slower) dateutil parser
+
+    Parameters
+    ----------
+    timestamp : str
+        The timestamp string from the webhook
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    datetime
+        The parsed timestamp
+    """
+
+    # ISO 8601, with 'Z' written as an offset for older Python versions
+    try:
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        pass
+
+    # Anything else
+    return parse(timestamp)
+
+
+@lru_cache(maxsize=1024)
+def _fmt_ts(raw, tz_name):
+    """Convert a raw timestamp to a simple local time
+
+    Alert bursts often share the same timestamp,
+        so results are cached on the raw string and timezone name
+
+    Parameters
+    ----------
+    raw : str
+        The timestamp string from the webhook
+    tz_name : str
+        The name of the local timezone
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    str
+        The local time, formatted as HH:MM:SS
+    """
+
+    timestamp = raw.replace(" UTC", "")
+    timestamp = _fast_parse(timestamp)
+    timestamp = timestamp.astimezone(timezone(tz_name))
+    return timestamp.strftime("%H:%M:%S")
+
+
+def _pack_ips(addresses):
+    """Pack source IP addresses to bytes, ready for SQL
+
+    Addresses that can't be parsed (eg, with a port, or 'unknown')
+        are skipped, rather than failing the whole webhook
+
+    Parameters
+    ----------
+    addresses : list
+        The IP addresses, as strings
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    packed : list
+        The packed addresses, as bytes
+    """
+
+    packed = []
+    for ip in addresses:
+        if not ip:
+            continue
+
+        family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+        try:
+            packed.append(socket.inet_pton(family, ip))
+        except (OSError, ValueError):
+            _cprint(f"Skipping unrecognized source IP: {ip!r}", "red")
+
+    return packed
+
+
+def _cprint(message, color):
+    """Print a coloured message to the terminal
+
+    termcolor is imported on first use, to keep plugin import light
+    The imported function is kept for later calls
+
+    Parameters
+    ----------
+    message : str
+        The message to print
+    color : str
+        The colour to print the message in
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    None
+    """
+
+    global _colored
+
+    if _colored is None:
+        from termcolor import colored
+        _colored = colored
+
+    print(_colored(message, color))
+
+
+def _drain():
+    """Send queued alerts in batches
+
+    Runs forever in a background thread
+    Waits for an alert, then collects any more that arrive shortly after
+    Each handler sends its alerts to Teams, then writes them to SQL
+
+    Parameters
+    ----------
+    None
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    None
+    """
+
+    while True:
+        # Wait for an alert, then briefly wait for more to batch with it
+        batch = [_QUEUE.get()]
+        deadline = monotonic() + _BATCH_WINDOW
+        while len(batch) < _BATCH_SIZE:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        _dispatch(batch)
+
+
+def _dispatch(batch):
+    """Send a batch of queued alerts
+
+    Alerts are grouped by the handler that queued them
+
+    Parameters
+    ----------
+    batch : list
+        A list of (handler, messages, event) tuples
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    None
+    """
+
+    # Group alerts by the handler that queued them
+    handlers = {}
+    for handler, messages, event in batch:
+        handlers.setdefault(id(handler), (handler, []))[1].append(
+            (messages, event)
+        )
+
+    # Send each group, making sure the worker survives any errors
+    for handler, items in handlers.values():
+        try:
+            handler.send(items)
+        except Exception as err:
+            _cprint("Error sending CloudFlare alerts", "red")
+            _cprint(err, "red")
+
+
+def _flush():
+    """Send any alerts still queued when the process exits
+
+    Registered with atexit, so queued alerts aren't silently lost
+
+    Parameters
+    ----------
+    None
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    None
+    """
+
+    batch = []
+    while True:
+        try:
+            batch.append(_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+
+    if batch:
+        _cprint(f"Flushing {len(batch)} queued CloudFlare alert(s)", "yellow")
+        _dispatch(batch)
+
+
+def _start_worker():
+    """Start the background worker, if it isn't running yet
+
+    Parameters
+    ----------
+    None
+
+    Raises
+    ------
+    None
+
+    Returns
+    -------
+    None
+    """
+
+    global _WORKER
+
+    with _WORKER_LOCK:
+        if _WORKER is None:
+            _WORKER = threading.Thread(target=_drain, daemon=True)
+            _WORKER.start()
+            atexit.register(_flush)
+
 
 class CloudFlareHandler(plugin.PluginTemplate):
     """The main class of the CloudFlare plugin
@@ -57,7 +463,12 @@ class CloudFlareHandler(plugin.PluginTemplate):
 
     Attributes
     ----------
-    None
+    _FIELD_TEMPLATE : dict
+        Empty fields, copied for each webhook
+    _FIELD_MAP : tuple
+        Maps each field to its webhook names, in order of preference
+    _ALERT_FIELD_MAPS : dict
+        Field maps for known alert types, keyed by alert_type
 
     Methods
     -------
@@ -76,14 +487,59 @@ class CloudFlareHandler(plugin.PluginTemplate):
         Authenticate the webhook
 
     log()
-        Send the alert to teams and write to SQL
+        Queue the alert for the background worker
+
+    send()
+        Send alerts to teams and write to SQL
     """
 
+    # Fields we extract from webhooks
+    #   Contains empty values by default to avoid KeyErrors
+    _FIELD_TEMPLATE = {
+        'type': '',
+        'time': '',
+        'src_ip': '',
+        'pool': '',
+        'service': '',
+        'health': '',
+        'reason': ''
+    }
+
+    # Webhook field names for each of our fields, in order of preference
+    _FIELD_MAP = (
+        ('type', ('alert_name', 'reason')),
+        ('pool', ('pool_name', 'name')),
+        ('service', ('origin_name', 'name')),
+        ('health', ('new_health', 'status')),
+        ('reason', ('origin_failure_reason', 'reason')),
+    )
+
+    # Field maps for alert types with a known structure
+    #   Unknown alert types fall back to _FIELD_MAP
+    _ALERT_FIELD_MAPS = {
+        'load_balancing_health_alert': (
+            ('type', ('alert_name', 'reason')),
+            ('pool', ('pool_name',)),
+            ('service', ('origin_name',)),
+            ('health', ('new_health',)),
+            ('reason', ('origin_failure_reason',)),
+        ),
+        'health_check_status_notification': (
+            ('type', ('alert_name', 'reason')),
+            ('pool', ('name',)),
+            ('service', ('name',)),
+            ('health', ('status',)),
+            ('reason', ('reason',)),
+        ),
+    }
+
     def __init__(self):
         """Constructs the class
 
         Loads the configuration file
-        Sets the SQL table
+        Sets the SQL table and Teams chat ID
+        Resolves the local timezone once, for timestamp conversion
+        Compiles the webhook schema validator
 
         Parameters
         ----------
@@ -99,7 +555,15 @@ class CloudFlareHandler(plugin.PluginTemplate):
         """
 
         super().__init__(LOCATION)
-        self.table = self.config['config']['sql_table']
+        cfg = self.config['config']
+        self.table = cfg['sql_table']
+        self.chat_id = cfg['chat_id']
+
+        # Resolve the local timezone once, rather than on every webhook
+        self._local_tz_name = str(get_localzone())
+
+        # Compile the schema once, and reuse it for every webhook
+        self._validate = fastjsonschema.compile(CLOUDFLARE_SCHEMA)
 
     def timestamp(self, json):
         """Reformat the timestamp to make it nicer
@@ -140,20 +604,20 @@ class CloudFlareHandler(plugin.PluginTemplate):
             timestamp = 'no timestamp'
             return timestamp
 
-        timestamp = timestamp.replace(" UTC", "")
-        timestamp = parse(timestamp)
-        timestamp = timestamp.astimezone(timezone(str(get_localzone())))
-        timestamp = timestamp.strftime("%H:%M:%S")
-
-        return timestamp
+        return _fmt_ts(timestamp, self._local_tz_name)
 
-    def fields(self, json):
+    def fields(self, json, alert_type=None):
         """Extract fields from the webhook
 
+        Known alert types use their own field map
+        Anything else uses the generic field map
+
         Parameters
         ----------
         json : json data
             The webhook (or part of it) that contains the fields we need
+        alert_type : str, optional
+            The alert type of the webhook
 
         Raises
         ------
@@ -165,45 +629,20 @@ class CloudFlareHandler(plugin.PluginTemplate):
             A dictionary of fields we can use
         """
 
-        # Build a simple dictionary of fields
-        #   Contains empty values by default to avoid KeyErrors
-        fields = {
-            'type': '',
-            'time': '',
-            'src_ip': '',
-            'pool': '',
-            'service': '',
-            'health': '',
-            'reason': ''
-        }
+        # Build a simple dictionary of fields from the template
+        fields = self._FIELD_TEMPLATE.copy()
+
+        # Pick the field map for this alert type
+        field_map = self._ALERT_FIELD_MAPS.get(alert_type, self._FIELD_MAP)
 
         # Add more fields if they are available
         #   Not all webhooks have all fields
         #   Some webhooks use different field names
-        if 'alert_name' in json:
-            fields['type'] = json['alert_name']
-        elif 'reason' in json:
-            fields['type'] = json['reason']
-
-        if 'pool_name' in json:
-            fields['pool'] = json['pool_name']
-        elif 'name' in json:
-            fields['pool'] = json['name']
-
-        if 'origin_name' in json:
-            fields['service'] = json['origin_name']
-        elif 'name' in json:
-            fields['service'] = json['name']
-
-        if 'new_health' in json:
-            fields['health'] = json['new_health']
-        elif 'status' in json:
-            fields['health'] = json['status']
-
-        if 'origin_failure_reason' in json:
-            fields['reason'] = json['origin_failure_reason']
-        elif 'status' in json:
-            fields['reason'] = json['reason']
+        for target, sources in field_map:
+            for source in sources:
+                if source in json:
+                    fields[target] = json[source]
+                    break
 
         return fields
 
@@ -211,6 +650,7 @@ class CloudFlareHandler(plugin.PluginTemplate):
         """Handle a webhook that has been sent to us
 
         Takes a webhook, and extracts useful fields
+        Webhooks that don't match the schema are logged and dropped
         If some expected fields aren't there, send a default message
         Build messages to send to Teams
 
@@ -231,52 +671,54 @@ class CloudFlareHandler(plugin.PluginTemplate):
         None
         """
 
+        # Check the webhook has the structure we expect
+        try:
+            self._validate(raw_response)
+        except fastjsonschema.JsonSchemaValueException as err:
+            _cprint(f"Invalid CloudFlare webhook: {err.message}", "red")
+            return
+
         # Focus on the important part of the webhook
         alert = raw_response['data']
-        print(termcolor.colored(f"CloudFlare Alert: {alert}", "yellow"))
+        if DEBUG:
+            _cprint(f"CloudFlare Alert: {alert}", "yellow")
 
         # Reformat the timestamp to make it nicer
         timestamp = self.timestamp(raw_response)
 
         # Reformat the source to separate IP addresses
         #   Some have two IPs, one IPv6 and one IPv4
-        src = src.split(",")
+        src = [ip.strip() for ip in src.split(",")]
 
         # Extract fields from the webhook
-        fields = self.fields(alert)
+        fields = self.fields(alert, raw_response.get('alert_type'))
+
+        # Pack the source IPs to bytes, ready for SQL
+        #   Bad addresses are skipped, and don't affect the alert
+        src_ip = _pack_ips(src)
 
         try:
             # Add a few fields of our own
             fields['time'] = timestamp
-            fields['src_ip'] = src
+            fields['src_ip'] = src_ip
 
         # If there's a problem extracting fields
         except Exception:
             fields['text'] = alert
             message = f"Cloudflare event: {fields['text']}"
 
-            print(termcolor.colored(
-                f"Unrecognized Cloudflare format:\n{raw_response}",
-                "cyan"
-            ))
+            _cprint(f"Unrecognized Cloudflare format:\n{raw_response}", "cyan")
 
         # Build a message for Teams
         else:
-            message = (f'<b><span style=\"color:Yellow\">{fields["type"]}'
-                       '</span></b> on <b><span style=\"color:Orange\">'
-                       f'{fields["pool"]} </span></b> at {fields["time"]}')
-
-            print(termcolor.colored(
-                f"CloudFlare fields:\n{fields}",
-                "cyan"
-            ))
-            print(termcolor.colored(
-                f"Raw webhook:\n{raw_response}",
-                "cyan"
-            ))
-
-        # Send the main message
-        self.log(message=message, event=fields)
+            message = _MSG_TMPL.format_map(fields)
+
+            if DEBUG:
+                _cprint(f"CloudFlare fields:\n{fields}", "cyan")
+                _cprint(f"Raw webhook:\n{raw_response}", "cyan")
+
+        # Collect the messages, so they can be sent together
+        messages = [message]
 
         # Create the health message, if there is anything to share
         if fields['health'] != '':
@@ -284,23 +726,15 @@ class CloudFlareHandler(plugin.PluginTemplate):
                 fields['service'] = fields['pool']
 
             if fields['health'] == 'Healthy':
-                health = \
-                    f"Current status for \
-                    <b><span style=\"color:Orange\"> \
-                    {fields['service']}</span></b> is  \
-                    <b><span style=\"color:Lime\"> \
-                    {fields['health']}</span></b>"
-
+                health = _HEALTHY_TMPL.format_map(fields)
             else:
-                health = \
-                    f"Current status for \
-                    <b><span style=\"color:Orange\"> \
-                    {fields['service']}</span></b> is  \
-                    <b><span style=\"color:Red\"> \
-                    {fields['health']}</span></b>"
+                health = _UNHEALTHY_TMPL.format_map(fields)
+
+            # Add the health status
+            messages.append(health)
 
-            # Send the health status
-            self.log(message=health, event=fields)
+        # Send all messages in one batch
+        self.log(messages=messages, event=fields)
 
     def authenticate(self, request, plugin):
         """Authenticate a webhook
@@ -309,6 +743,7 @@ class CloudFlareHandler(plugin.PluginTemplate):
         Checks that the correct header exists in the webhook
         Compares the password to the one we have in our config
         CloudFlare sends the passwords in plain text
+        The comparison is constant-time, to prevent timing attacks
 
         Parameters
         ----------
@@ -330,34 +765,45 @@ class CloudFlareHandler(plugin.PluginTemplate):
         """
 
         # Get the secret we know
+        #   If no secret is configured, nothing can authenticate
         local_secret = plugin['handler'].webhook_secret
+        if not local_secret:
+            return False
 
         # Get the secret sent in the webhook
-        sender_secret = request.headers[self.auth_header]
+        #   Fail straight away if the header is missing
+        sender_secret = request.headers.get(self.auth_header)
+        if sender_secret is None:
+            return False
 
-        # Compare them
-        if local_secret == sender_secret:
-            return True
-        else:
+        # Compare them in constant time, to avoid leaking timing information
+        #   Compared as bytes, as compare_digest only accepts ASCII strings
+        if isinstance(local_secret, str):
+            local_secret = local_secret.encode()
+        if isinstance(sender_secret, str):
+            sender_secret = sender_secret.encode()
+        if not isinstance(local_secret, bytes) or \
+                not isinstance(sender_secret, bytes):
             return False
 
-    def log(self, message, event):
-        """Send alert and log to SQL
+        return hmac.compare_digest(local_secret, sender_secret)
 
-        Sends a message to teams
-        Logs interesting fields to SQL
+    def log(self, messages, event):
+        """Queue an alert to send to Teams and log to SQL
+
+        The alert is handled by a background worker,
+            so the webhook can return without waiting for Teams or SQL
 
         Parameters
         ----------
-        message : str
-            The message to send to teams
+        messages : list
+            The messages to send to teams
         event : dict
             Interesting fields to log to SQL
 
         Raises
         ------
-        Exception
-            If there were problems sending to Teams
+        None
 
         Returns
         -------
@@ -365,58 +811,110 @@ class CloudFlareHandler(plugin.PluginTemplate):
         """
 
         # Log to the terminal
-        print(termcolor.colored(f"CloudFlare event: {event}", "yellow"))
+        if DEBUG:
+            _cprint(f"CloudFlare event: {event}", "yellow")
 
-        # Send to teams, and get the Teams ID
+        # Hand over to the background worker
+        #   Don't block the webhook if the queue is full
+        _start_worker()
         try:
-            chat_id = teamschat.send_chat(
-                message,
-                self.config['config']['chat_id']
-            )['id']
+            _QUEUE.put_nowait((self, messages, event))
+        except queue.Full:
+            _cprint(f"CloudFlare queue full, dropped alert: {event}", "red")
 
-        # If there was a problem, log to terminal
-        except Exception as err:
-            print(termcolor.colored("Error with Teams chat ID", "red"))
-            print(termcolor.colored(err, "red"))
-            return
+    def send(self, batch):
+        """Send alerts and log to SQL
+
+        Called by the background worker with a batch of queued alerts
+        Sends one teams message per alert (per webhook)
+        Then logs interesting fields to SQL, one row per alert
+        A failed Teams message or SQL write is logged,
+            and doesn't affect the other alerts
+
+        Parameters
+        ----------
+        batch : list
+            A list of (messages, event) tuples
+
+        Raises
+        ------
+        None
+
+        Returns
+        -------
+        None
+        """
+
+        # Send each alert to teams, and collect the rows to write to SQL
+        rows = []
+        for messages, event in batch:
+            # Send to teams, and get the Teams ID
+            try:
+                chat_id = teamschat.send_chat(
+                    "<br/>".join(messages),
+                    self.chat_id
+                )['id']
+
+            # If there was a problem, log the dropped alert to terminal
+            except Exception as err:
+                _cprint("Error with Teams chat ID", "red")
+                _cprint(err, "red")
+                _cprint(f"Dropped CloudFlare alert: {event}", "red")
+                continue
+
+            rows.append((event, chat_id))
 
         # Collect the fields to write to SQL
-        date = datetime.now().date()
-        time = datetime.now().time().strftime("%H:%M:%S")
+        #   Read the clock once, so the date and time always match
+        now = datetime.now()
+        date = now.date()
+        time = now.strftime("%H:%M:%S")
+
+        for event, chat_id in rows:
+            if event['type'] == '':
+                event_type = 'Unknown'
+            else:
+                event_type = event['type']
 
-        if event['type'] == '':
-            event_type = 'Unknown'
-        else:
-            event_type = event['type']
+            if event['pool'] == '':
+                pool = 'Unknown'
+            else:
+                pool = event['pool']
 
-        if event['pool'] == '':
-            pool = 'Unknown'
-        else:
-            pool = event['pool']
+            if event['service'] == '':
+                event_service = 'Unknown'
+            else:
+                event_service = event['service']
 
-        if event['service'] == '':
-            event_service = 'Unknown'
-        else:
-            event_service = event['service']
-
-        source = ''
-        for item in event['src_ip']:
-            source += item
-
-        fields = {
-            'type': f"\'{event_type}\'",
-            'pool': f"\'{pool}\'",
-            'service': f"\'{event_service}\'",
-            'health': f"\'{event['health']}\'",
-            'reason': f"\'{event['reason']}\'",
-            'logdate': f"\'{date}\'",
-            'logtime': f"\'{time}\'",
-            'source': f"\'{source}\'",
-            'message': f"\'{chat_id}\'"
-        }
-
-        # Write to SQL
-        self.sql_write(
-            database=self.config['config']['sql_table'],
-            fields=fields
-        )
+            # The source is written as a binary literal
+            if event['src_ip']:
+                source = '0x' + event['src_ip'][0].hex()
+            else:
+                source = '0x'
+
+            fields = {
+                'type': f"\'{event_type}\'",
+                'pool': f"\'{pool}\'",
+                'service': f"\'{event_service}\'",
+                'health': f"\'{event['health']}\'",
+                'reason': f"\'{event['reason']}\'",
+                'logdate': f"\'{date}\'",
+                'logtime': f"\'{time}\'",
+                'source': source,
+                'message': f"\'{chat_id}\'"
+            }
+
+            # Write to SQL
+            try:
+                self.sql_write(
+                    database=self.table,
+                    fields=fields
+                )
+
+            # If there was a problem, log to terminal and carry on
+            except Exception as err:
+                _cprint(
+                    f"Error writing CloudFlare event to SQL: {event}",
+                    "red"
+                )
+                _cprint(err, "red")
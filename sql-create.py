@@ -39,15 +39,21 @@ import sys
 import yaml
 
 
-def connect(server, db):
+def connect(server, db, autocommit=False):
     '''
     Connect to an SQL server
 
+    The cursor has fast_executemany enabled
+        Bulk inserts should use cursor.executemany(sql, rows),
+        then commit once, rather than executing and committing per row
+
     Parameters:
         server : str
             The server to connect to
         db : str
             The database to connect to
+        autocommit : bool
+            Commit after every statement (default False)
 
     Raises:
         pyodbc.DataError
@@ -77,7 +83,8 @@ def connect(server, db):
             'Server=%s;'
             'Database=%s;'
             'Trusted_Connection=yes;'
-            % (server, db))
+            % (server, db),
+            autocommit=autocommit)
 
     except pyodbc.DataError as e:
         print("A data error has occurred")
@@ -134,7 +141,9 @@ def connect(server, db):
         return False
 
     # If the connection was successful, create a cursor
+    #   Send executemany() parameters as a single batch
     cursor = conn.cursor()
+    cursor.fast_executemany = True
 
     # Return the connection and the cursor as a tuple
     return conn, cursor
@@ -185,10 +194,8 @@ def create_table(table, fields, connector):
     '''
 
     # Build a valid SQL 'CREATE TABLE' command
-    sql_string = (f'CREATE TABLE {table} (')
-    for field in fields:
-        sql_string += field + ' ' + fields[field] + ','
-    sql_string += ')'
+    cols = ", ".join(f"{name} {ctype}" for name, ctype in fields.items())
+    sql_string = f'CREATE TABLE {table} ({cols})'
 
     # Attempt to connect to the SQL server
     try:
@@ -263,7 +270,7 @@ if __name__ == '__main__':
         'reason': 'text null',
         'logdate': 'date not null',
         'logtime': 'time not null',
-        'source': 'nvarchar(max) not null',
+        'source': 'varbinary(16) not null',
         'message': 'text null'
     }
 